@@ -3,10 +3,27 @@ import asyncio
 import d4seo_client
 from database import AuditJob  # Importujemy model bazy danych
 
-async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthouse_data: dict) -> dict:
+# Pola elementów "items", które zostawiamy po strumieniowym parsowaniu
+# odpowiedzi D4SEO. Tylko pola faktycznie czytane w build_final_report —
+# pusta krotka oznacza, że elementów w ogóle nie trzymamy w pamięci
+# (zostają tylko pola zbiorcze wyniku, np. total_items_count).
+# Dopisz pola, gdy sekcja raportu zacznie z nich korzystać.
+ITEM_FIELDS = {
+    "pages": (),
+    "duplicate_tags": ("url", "title", "tag"),
+    "links": (),
+    "resources": (),
+    "non_indexable": (),
+    "redirect_chains": (),
+}
+
+async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthouse_data: dict) -> tuple[dict, dict]:
     """
     Orkiestrator agregacji. Pobiera wszystkie dane ze wszystkich endpointów D4SEO
     i buduje finalny JSON dla GPT.
+
+    Zwraca (raport, problemy): raport ma tylko po 3 przykłady na sekcję,
+    a `problemy` to pełne listy {sekcja: [{"url", "issue"}]} dla snapshotów.
     """
     
     print(f"[{job.job_id}] Rozpoczynanie agregacji danych dla: {job.domain}")
@@ -25,12 +42,12 @@ async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthous
     try:
         results = await asyncio.gather(
             # Pomijamy get_onpage_summary i get_lighthouse_data, bo już je mamy
-            d4seo_client.get_onpage_pages(onpage_task_id),
-            d4seo_client.get_onpage_duplicate_tags(onpage_task_id),
-            d4seo_client.get_onpage_links(onpage_task_id),
-            d4seo_client.get_onpage_resources(onpage_task_id),
-            d4seo_client.get_onpage_non_indexable(onpage_task_id),
-            d4seo_client.get_onpage_redirect_chains(onpage_task_id),
+            d4seo_client.get_onpage_pages(onpage_task_id, fields=ITEM_FIELDS["pages"]),
+            d4seo_client.get_onpage_duplicate_tags(onpage_task_id, fields=ITEM_FIELDS["duplicate_tags"]),
+            d4seo_client.get_onpage_links(onpage_task_id, fields=ITEM_FIELDS["links"]),
+            d4seo_client.get_onpage_resources(onpage_task_id, fields=ITEM_FIELDS["resources"]),
+            d4seo_client.get_onpage_non_indexable(onpage_task_id, fields=ITEM_FIELDS["non_indexable"]),
+            d4seo_client.get_onpage_redirect_chains(onpage_task_id, fields=ITEM_FIELDS["redirect_chains"]),
             d4seo_client.get_security_headers(job.domain)
             # TODO: Dodaj tutaj resztę wywołań (np. duplicate_content, content_parsing)
         )
@@ -65,11 +82,12 @@ async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthous
         "missingDescriptions": summary_checks.get("no_description", 0),
         "duplicateDescriptions": summary_metrics.get("duplicate_description", 0)
     }
-    meta_examples = [
+    meta_issues = [
         {"url": item["url"], "issue": f"Zduplikowany tytuł: '{item['title']}'"}
         for item in raw_data["duplicate_tags"].get("items", []) 
         if item.get("tag") == "title"
-    ][:3] # Weź 3 przykłady
+    ]
+    meta_examples = meta_issues[:3] # Weź 3 przykłady
     # TODO: Dodaj przykłady dla "brakującego opisu" z `raw_data["pages"]`
 
     # --- Sekcja 11: Wydajność ---
@@ -80,10 +98,16 @@ async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthous
         "unusedJsKiB": int(lighthouse_items.get("unused_javascript", {}).get("details", {}).get("overallSavingsKiB", 0)),
         "largeImageKiB": int(lighthouse_items.get("uses_optimized_images", {}).get("details", {}).get("overallSavingsKiB", 0))
     }
-    perf_examples = [
+    perf_issues = [
         {"url": item["url"], "issue": "Zasób blokujący renderowanie"}
         for item in lighthouse_items.get("render_blocking_resources", {}).get("details", {}).get("items", [])
-    ][:3]
+    ]
+    perf_examples = perf_issues[:3]
+
+    # --- Sekcja 12: Bezpieczeństwo ---
+    security_issues = [
+        {"url": f"https://{job.domain}", "issue": "Brak nagłówka Strict-Transport-Security (HSTS)"}
+    ] if not raw_data["security"]["hsts"] else []
 
     # --- Składanie finalnego raportu ---
     final_report = {
@@ -163,11 +187,16 @@ async def build_final_report(job: AuditJob, onpage_summary_data: dict, lighthous
             "status": "do_poprawy" if not raw_data["security"]["hsts"] else "poprawny",
             "summary": "Brak kluczowych nagłówków bezpieczeństwa, w tym HSTS.", # TODO: Uczyń to dynamicznym
             "findings": raw_data["security"],
-            "examples": [
-                {"url": f"https://{job.domain}", "issue": "Brak nagłówka Strict-Transport-Security (HSTS)"}
-            ] if not raw_data["security"]["hsts"] else []
+            "examples": security_issues[:3]
         }
     }
+
+    # Pełne (nieprzycięte) listy problemów — do historii audytów
+    all_issues = {
+        "metaData": meta_issues,
+        "performance": perf_issues,
+        "security": security_issues
+    }
     
     print(f"[{job.job_id}] Mapowanie zakończone. Zwracanie raportu do GPT.")
-    return final_report
+    return final_report, all_issues
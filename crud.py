@@ -1,7 +1,9 @@
 # Plik: crud.py
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from database import AuditJob
+from database import AuditJob, AuditSnapshot
 import uuid
+import datetime
 
 def create_job(db: Session, domain: str) -> AuditJob:
     """Tworzy nowy wpis zadania w bazie danych."""
@@ -44,3 +46,57 @@ def delete_job(db: Session, job_id: str):
     if job:
         db.delete(job)
         db.commit()
+
+def count_active_jobs(db: Session, since: datetime.datetime) -> int:
+    """Liczy skany w toku (bez webhooka On-Page lub Lighthouse) utworzone po `since`."""
+    return db.query(AuditJob).filter(
+        or_(AuditJob.onpage_status == "pending", AuditJob.lighthouse_status == "pending"),
+        AuditJob.created_at >= since
+    ).count()
+
+# --- Snapshoty audytów (historia domeny) ---
+
+def get_latest_snapshot(db: Session, domain: str) -> AuditSnapshot | None:
+    """Pobiera najnowszy snapshot domeny."""
+    return db.query(AuditSnapshot).filter(
+        AuditSnapshot.domain == domain
+    ).order_by(AuditSnapshot.seq.desc()).first()
+
+def get_snapshot_by_job(db: Session, job_id: str) -> AuditSnapshot | None:
+    """Pobiera snapshot zapisany dla danego zadania audytu."""
+    return db.query(AuditSnapshot).filter(AuditSnapshot.job_id == job_id).first()
+
+def get_keyframe_snapshot(db: Session, domain: str, seq: int) -> AuditSnapshot | None:
+    """Pobiera ostatni snapshot z pełnym stanem o numerze <= seq."""
+    return db.query(AuditSnapshot).filter(
+        AuditSnapshot.domain == domain,
+        AuditSnapshot.seq <= seq,
+        AuditSnapshot.state.isnot(None)
+    ).order_by(AuditSnapshot.seq.desc()).first()
+
+def get_snapshot_deltas(db: Session, domain: str, after_seq: int, until_seq: int | None = None) -> list:
+    """Pobiera (seq, delta) snapshotów o numerach z przedziału (after_seq, until_seq]."""
+    query = db.query(AuditSnapshot.seq, AuditSnapshot.delta).filter(
+        AuditSnapshot.domain == domain,
+        AuditSnapshot.seq > after_seq
+    )
+    if until_seq is not None:
+        query = query.filter(AuditSnapshot.seq <= until_seq)
+    return query.order_by(AuditSnapshot.seq).all()
+
+def list_snapshot_stats(db: Session, domain: str, limit: int = 52) -> list:
+    """Pobiera (seq, created_at, stats) ostatnich snapshotów, od najstarszego."""
+    rows = db.query(
+        AuditSnapshot.seq, AuditSnapshot.created_at, AuditSnapshot.stats
+    ).filter(
+        AuditSnapshot.domain == domain
+    ).order_by(AuditSnapshot.seq.desc()).limit(limit).all()
+    return list(reversed(rows))
+
+def create_snapshot(db: Session, **fields) -> AuditSnapshot:
+    """Zapisuje nowy snapshot audytu."""
+    snapshot = AuditSnapshot(**fields)
+    db.add(snapshot)
+    db.commit()
+    db.refresh(snapshot)
+    return snapshot
@@ -3,6 +3,8 @@ import httpx
 import os
 import base64
 import asyncio
+import contextlib
+import ijson
 
 # Pobierz dane logowania ze zmiennych środowiskowych
 D4SEO_LOGIN = os.environ["D4SEO_LOGIN"]
@@ -19,8 +21,8 @@ HEADERS = {"Authorization": f"Basic {auth_header}", "Content-Type": "application
 # Używamy jednego, globalnego klienta asynchronicznego
 client = httpx.AsyncClient(base_url=BASE_URL, headers=HEADERS, timeout=30.0)
 
-async def start_onpage_task(domain: str, job_id: str) -> str:
-    """Uruchamia główne zadanie On-Page."""
+async def start_onpage_task(domain: str, job_id: str) -> tuple[str, float]:
+    """Uruchamia główne zadanie On-Page. Zwraca (ID zadania, koszt w USD)."""
     print(f"[{job_id}] Uruchamianie zadania On-Page dla: {domain}")
     post_data = [{
         "target": domain,
@@ -32,12 +34,13 @@ async def start_onpage_task(domain: str, job_id: str) -> str:
     }]
     response = await client.post("/on_page/task_post", json=post_data)
     response.raise_for_status() # Zatrzyma, jeśli D4SEO zwróci błąd
-    task_id = response.json()["tasks"][0]["id"]
-    print(f"[{job_id}] Zadanie On-Page uruchomione: {task_id}")
-    return task_id
+    task = response.json()["tasks"][0]
+    task_id, cost = task["id"], float(task.get("cost") or 0.0)
+    print(f"[{job_id}] Zadanie On-Page uruchomione: {task_id} (koszt: ${cost})")
+    return task_id, cost
 
-async def start_lighthouse_task(domain: str, job_id: str) -> str:
-    """Uruchamia zadanie Lighthouse dla strony głównej."""
+async def start_lighthouse_task(domain: str, job_id: str) -> tuple[str, float]:
+    """Uruchamia zadanie Lighthouse dla strony głównej. Zwraca (ID zadania, koszt w USD)."""
     print(f"[{job_id}] Uruchamianie zadania Lighthouse dla: {domain}")
     post_data = [{
         "url": f"https://{domain}",
@@ -46,84 +49,163 @@ async def start_lighthouse_task(domain: str, job_id: str) -> str:
     }]
     response = await client.post("/on_page/lighthouse/task_post", json=post_data)
     response.raise_for_status()
-    task_id = response.json()["tasks"][0]["id"]
-    print(f"[{job_id}] Zadanie Lighthouse uruchomione: {task_id}")
-    return task_id
+    task = response.json()["tasks"][0]
+    task_id, cost = task["id"], float(task.get("cost") or 0.0)
+    print(f"[{job_id}] Zadanie Lighthouse uruchomione: {task_id} (koszt: ${cost})")
+    return task_id, cost
+
+# --- STRUMIENIOWE PARSOWANIE ODPOWIEDZI D4SEO ---
+# Odpowiedzi z listami (links, resources, ...) potrafią mieć wiele MB.
+# Zamiast response.json() czytamy ciało kawałkami przez ijson i budujemy
+# tylko tasks[0].result[0], a elementy "items" oddajemy pojedynczo
+# (opcjonalnie tylko z wybranymi polami).
+
+RESULT_PREFIX = "tasks.item.result.item"
+ITEMS_PREFIX = RESULT_PREFIX + ".items"
+ITEM_PREFIX = ITEMS_PREFIX + ".item"
+
+class _AsyncBodyReader:
+    """Adapter: ijson czyta ciało odpowiedzi httpx kawałek po kawałku."""
+
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""  # ijson sprawdza typ danych przez read(0)
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+def _project(item, fields: tuple[str, ...] | None):
+    """Zostawia w elemencie tylko pola, które czyta agregacja."""
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {key: item[key] for key in fields if key in item}
+
+async def iter_result_items(method: str, path: str, post_data: list | None = None,
+                            fields: tuple[str, ...] | None = None, meta: dict | None = None):
+    """
+    Generator asynchroniczny: zwraca po jednym elemencie z
+    tasks[0].result[0].items. Jeśli podano `meta`, uzupełnia go
+    pozostałymi polami result[0] (z pustą listą w miejscu "items").
+    """
+    status_message = None
+    found_result = False
+    item_builder = None
+    meta_builder = None
+
+    async with client.stream(method, path, json=post_data) as response:
+        response.raise_for_status()
+        events = ijson.parse_async(_AsyncBodyReader(response), use_float=True)
+        async for prefix, event, value in events:
+            if prefix == ITEM_PREFIX or prefix.startswith(ITEM_PREFIX + "."):
+                if item_builder is None and event not in ("start_map", "start_array"):
+                    yield value  # Element skalarny
+                    continue
+                if item_builder is None:
+                    item_builder = ijson.ObjectBuilder()
+                item_builder.event(event, value)
+                if prefix == ITEM_PREFIX and event in ("end_map", "end_array"):
+                    yield _project(item_builder.value, fields)
+                    item_builder = None
+
+            elif prefix == RESULT_PREFIX or prefix.startswith(RESULT_PREFIX + "."):
+                if prefix == RESULT_PREFIX and event == "start_map":
+                    found_result = True
+                    if meta is not None:
+                        meta_builder = ijson.ObjectBuilder()
+                if meta_builder is not None:
+                    meta_builder.event(event, value)
+                if prefix == RESULT_PREFIX and event == "end_map":
+                    if meta_builder is not None:
+                        meta.update(meta_builder.value)
+                    break  # Potrzebujemy tylko result[0] — resztę odpowiedzi pomijamy
+
+            elif prefix == "tasks.item.status_message" and status_message is None:
+                status_message = value
+
+    if not found_result:
+        raise ValueError(f"D4SEO nie zwróciło wyniku dla {path}: {status_message}")
+
+async def _fetch_result(method: str, path: str, post_data: list | None = None,
+                        fields: tuple[str, ...] | None = None) -> dict:
+    """
+    Strumieniowy odpowiednik response.json()["tasks"][0]["result"][0].
+    Przy `fields=()` elementy są tylko przeczytane i odrzucone
+    ("items" zostaje pustą listą), więc pamięć nie rośnie z ich liczbą.
+    """
+    result = {}
+    items = []
+    stream = iter_result_items(method, path, post_data, fields, meta=result)
+    async with contextlib.aclosing(stream):
+        async for item in stream:
+            if fields != ():
+                items.append(item)
+    if isinstance(result.get("items"), list):
+        result["items"] = items
+    return result
 
 # --- PONIŻEJ FUNKCJE DO POBIERANIA WYNIKÓW (DLA AGREGACJI) ---
 
 async def get_onpage_summary(task_id: str) -> dict:
     """Pobiera główny raport On-Page Summary."""
     print(f"Pobieranie: OnPage Summary (dla {task_id})")
-    response = await client.get(f"/on_page/summary/{task_id}")
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("GET", f"/on_page/summary/{task_id}")
 
 async def get_lighthouse_data(task_id: str) -> dict:
     """Pobiera gotowe dane z Lighthouse."""
     print(f"Pobieranie: Lighthouse data (dla {task_id})")
-    response = await client.get(f"/on_page/lighthouse/task_get/json/{task_id}")
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("GET", f"/on_page/lighthouse/task_get/json/{task_id}")
 
-async def get_onpage_pages(task_id: str, limit: int = 100) -> dict:
+async def get_onpage_pages(task_id: str, limit: int = 100, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera listę wszystkich stron."""
     print(f"Pobieranie: OnPage Pages (limit {limit})")
     post_data = [{"id": task_id, "limit": limit}]
-    response = await client.post("/on_page/pages", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/pages", post_data, fields)
 
-async def get_onpage_duplicate_tags(task_id: str, limit: int = 50) -> dict:
+async def get_onpage_duplicate_tags(task_id: str, limit: int = 50, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera przykłady zduplikowanych tagów."""
     print(f"Pobieranie: Duplicate Tags (limit {limit})")
     post_data = [{"id": task_id, "limit": limit}]
-    response = await client.post("/on_page/duplicate_tags", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/duplicate_tags", post_data, fields)
 
-async def get_onpage_links(task_id: str, limit: int = 2000) -> dict:
+async def get_onpage_links(task_id: str, limit: int = 2000, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera linki (dla anchor text i stron-sierot)."""
     print(f"Pobieranie: Links (limit {limit})")
     # TODO: Dodaj filtry, aby pobierać tylko linki wewnętrzne
     post_data = [{"id": task_id, "limit": limit}]
-    response = await client.post("/on_page/links", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/links", post_data, fields)
     
-async def get_onpage_resources(task_id: str, limit: int = 1000) -> dict:
+async def get_onpage_resources(task_id: str, limit: int = 1000, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera zasoby (dla obrazków)."""
     print(f"Pobieranie: Resources (limit {limit})")
     post_data = [{"id": task_id, "limit": limit, "filters": ["resource_type", "=", "image"]}]
-    response = await client.post("/on_page/resources", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/resources", post_data, fields)
 
-async def get_onpage_non_indexable(task_id: str, limit: int = 500) -> dict:
+async def get_onpage_non_indexable(task_id: str, limit: int = 500, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera strony nieindeksowalne."""
     print(f"Pobieranie: Non-Indexable (limit {limit})")
     post_data = [{"id": task_id, "limit": limit}]
-    response = await client.post("/on_page/non_indexable", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/non_indexable", post_data, fields)
 
-async def get_onpage_redirect_chains(task_id: str, limit: int = 50) -> dict:
+async def get_onpage_redirect_chains(task_id: str, limit: int = 50, fields: tuple[str, ...] | None = None) -> dict:
     """Pobiera łańcuchy przekierowań."""
     print(f"Pobieranie: Redirect Chains (limit {limit})")
     post_data = [{"id": task_id, "limit": limit}]
-    response = await client.post("/on_page/redirect_chains", json=post_data)
-    response.raise_for_status()
-    return response.json()["tasks"][0]["result"][0]
+    return await _fetch_result("POST", "/on_page/redirect_chains", post_data, fields)
     
 async def get_onpage_content_parsing(task_id: str, url: str) -> dict:
     """Pobiera word_count dla JEDNEJ, konkretnej strony."""
     print(f"Pobieranie: Content Parsing (dla {url})")
     post_data = [{"id": task_id, "url": url}]
-    response = await client.post("/on_page/content_parsing", json=post_data)
-    response.raise_for_status()
-    # Zwraca `items` lub pusty słownik, jeśli brak danych
-    items = response.json()["tasks"][0]["result"][0].get("items")
-    return items[0] if items else {}
+    # Zwraca pierwszy element `items` lub pusty słownik, jeśli brak danych
+    stream = iter_result_items("POST", "/on_page/content_parsing", post_data)
+    async with contextlib.aclosing(stream):
+        async for item in stream:
+            return item
+    return {}
 
 async def get_security_headers(domain: str) -> dict:
     """Nasz własny checker nagłówków bezpieczeństwa (poza D4SEO)."""
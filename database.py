@@ -1,6 +1,6 @@
 # Plik: database.py
 import os
-from sqlalchemy import create_engine, Column, String, JSON, DateTime
+from sqlalchemy import create_engine, Column, String, JSON, DateTime, Integer, UniqueConstraint
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
@@ -51,6 +51,33 @@ class AuditJob(Base):
     
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+class AuditSnapshot(Base):
+    """
+    Model tabeli 'audit_snapshots' — historia ukończonych audytów domeny.
+    Każdy snapshot to delta względem poprzedniego; co kilkadziesiąt
+    snapshotów (i w pierwszym) zapisujemy też pełny stan, żeby odtwarzanie
+    nie musiało czytać całej historii.
+    """
+    __tablename__ = "audit_snapshots"
+    __table_args__ = (UniqueConstraint("domain", "seq", name="uq_audit_snapshots_domain_seq"),)
+
+    id = Column(Integer, primary_key=True)
+    domain = Column(String, index=True)
+    # Projekt z Firestore (dla audytów z harmonogramu), informacyjnie
+    project_id = Column(String, nullable=True)
+    # Zadanie, z którego powstał snapshot — jeden snapshot na zadanie
+    job_id = Column(String, nullable=True, unique=True)
+    # Numer kolejny snapshotu w obrębie domeny (0, 1, 2, ...)
+    seq = Column(Integer)
+
+    # Pełny stan (tylko w snapshotach "kluczowych") i delta względem poprzedniego
+    state = Column(JSON, nullable=True)
+    delta = Column(JSON, nullable=True)
+    # Małe podsumowanie (statusy, liczby) — wystarcza do zapytań o trendy
+    stats = Column(JSON)
+
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 def create_tables():
     """Tworzy tabelę w bazie danych przy starcie aplikacji."""
     print("Tworzenie tabel (jeśli nie istnieją)...")
@@ -9,6 +9,8 @@ import crud
 import d4seo_client
 import aggregation
 import database
+import scheduler
+import snapshots
 from models import StartAuditRequest
 import httpx
 import uuid
@@ -35,10 +37,14 @@ async def startup_event():
         headers=d4seo_client.HEADERS, 
         timeout=30.0
     )
+    # Cykliczne audyty projektów wymagają Firestore ('db' z Etapu 2)
+    if db and scheduler.SCHEDULER_ENABLED:
+        scheduler.start(db)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Zamyka klienta HTTPX przy zamknięciu aplikacji."""
+    await scheduler.stop()
     await d4seo_client.client.aclose()
 
 # ---------------------------------------------------------------
@@ -87,8 +93,8 @@ async def start_audit_endpoint(
         job = crud.create_job(db=db_session, domain=domain)
         job_id = job.job_id
 
-        onpage_task_id = await d4seo_client.start_onpage_task(domain, job_id)
-        lighthouse_task_id = await d4seo_client.start_lighthouse_task(domain, job_id)
+        onpage_task_id, onpage_cost = await d4seo_client.start_onpage_task(domain, job_id)
+        lighthouse_task_id, lighthouse_cost = await d4seo_client.start_lighthouse_task(domain, job_id)
 
         crud.update_job(db_session, job_id, {
             "onpage_task_id": onpage_task_id,
@@ -96,7 +102,6 @@ async def start_audit_endpoint(
         })
 
         print(f"[{job_id}] Pomyślnie uruchomiono zadania dla {domain}.")
-        return {"status": "pending", "job_id": job_id}
         
     except Exception as e:
         print(f"[ERROR] /start-audit: {e}")
@@ -104,6 +109,14 @@ async def start_audit_endpoint(
             crud.delete_job(db_session, job.job_id)
         raise HTTPException(status_code=500, detail=f"Failed to start audit: {str(e)}")
 
+    # Koszt audytu liczy się do wspólnego dziennego budżetu schedulera
+    if db:
+        try:
+            scheduler.record_spend(db, onpage_cost + lighthouse_cost)
+        except Exception as e:
+            print(f"[{job_id}] Nie udało się zapisać kosztu audytu: {e}")
+    return {"status": "pending", "job_id": job_id}
+
 
 @app.get("/webhook/onpage-done")
 async def webhook_onpage_done(
@@ -161,7 +174,11 @@ async def check_audit_status_endpoint(
         try:
             onpage_summary_data = await d4seo_client.get_onpage_summary(job.onpage_task_id)
             lighthouse_data = await d4seo_client.get_lighthouse_data(job.lighthouse_task_id)
-            final_report_data = await aggregation.build_final_report(job, onpage_summary_data, lighthouse_data)
+            final_report_data, all_issues = await aggregation.build_final_report(job, onpage_summary_data, lighthouse_data)
+            try:
+                snapshots.record_snapshot(db_session, job.domain, final_report_data, all_issues, job_id=job_id)
+            except Exception as e:
+                print(f"[{job_id}] Nie udało się zapisać snapshotu: {e}")
             background_tasks.add_task(crud.delete_job, db_session, job_id)
             return {"status": "completed", "data": final_report_data}
         except Exception as e:
@@ -186,6 +203,14 @@ else:
 # === KONIEC POPRAWKI ===
 
 
+# ---------------------------------------------------------------
+# 🔧 Etap 5: Historia audytów (snapshoty, trendy, zmiany)
+# ---------------------------------------------------------------
+from snapshot_routes import router as snapshot_router
+
+app.include_router(snapshot_router)
+
+
 # ---------------------------------------------------------------
 # Testowy endpoint
 # ---------------------------------------------------------------
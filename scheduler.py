@@ -0,0 +1,370 @@
+# Plik: scheduler.py
+# ================================================================
+# Cykliczne audyty projektów z Firestore (kolekcja "projects").
+#
+# - Tylko jeden worker (lider) planuje audyty — wybór lidera przez
+#   advisory lock w PostgreSQL (pg_try_advisory_lock).
+# - Kolejka priorytetowa (heapq) terminów audytów, z losowym
+#   rozrzutem (jitter), żeby nocne audyty nie startowały naraz.
+# - Globalny budżet: limit równoległych skanów i dziennych kosztów D4SEO.
+# ================================================================
+import asyncio
+import datetime
+import heapq
+import os
+import random
+
+from firebase_admin import firestore
+from sqlalchemy import text
+
+import aggregation
+import crud
+import d4seo_client
+import database
+import snapshots
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+# Dowolna stała liczba — musi być taka sama na wszystkich workerach
+SCHEDULER_LOCK_KEY = int(os.environ.get("SCHEDULER_LOCK_KEY", "727001"))
+TICK_SECONDS = int(os.environ.get("SCHEDULER_TICK_SECONDS", "60"))
+REFRESH_SECONDS = int(os.environ.get("SCHEDULER_REFRESH_SECONDS", "600"))
+JITTER_MINUTES = int(os.environ.get("SCHEDULER_JITTER_MINUTES", "360"))
+RETRY_MINUTES = int(os.environ.get("SCHEDULER_RETRY_MINUTES", "30"))
+
+# Budżet globalny — liczony łącznie z audytami z /start-audit
+# (main.py też zapisuje ich koszt przez record_spend)
+MAX_CONCURRENT_CRAWLS = int(os.environ.get("SCHEDULER_MAX_CONCURRENT_CRAWLS", "3"))
+DAILY_BUDGET_USD = float(os.environ.get("SCHEDULER_DAILY_BUDGET_USD", "5.0"))
+# Szacunkowy koszt jednego audytu (On-Page 1000 stron + Lighthouse) — tylko do
+# sprawdzenia budżetu przed startem; naliczamy faktyczny koszt zwrócony przez D4SEO
+AUDIT_COST_USD = float(os.environ.get("SCHEDULER_AUDIT_COST_USD", "0.15"))
+# Po tym czasie zadanie bez webhooków uznajemy za martwe
+JOB_TIMEOUT_HOURS = int(os.environ.get("SCHEDULER_JOB_TIMEOUT_HOURS", "6"))
+
+# Pole "audit_cadence" w dokumencie projektu: nazwa lub liczba dni
+CADENCES = {"daily": 1, "weekly": 7, "biweekly": 14, "monthly": 30}
+
+# Koszt dzienny: jeden dokument na dzień, np. scheduler_state/budget-2026-10-19
+BUDGET_COLLECTION = "scheduler_state"
+
+_task = None
+_lock_conn = None  # Połączenie trzymające advisory lock (tylko u lidera)
+_queue = []        # heap: (run_at, project_id, due)
+_planned = {}      # project_id -> (due, run_at), żeby jitter był stabilny między odświeżeniami
+_projects = {}     # project_id -> domena
+_scheduled_jobs = {}  # job_id -> project_id
+_launched_due = {}    # project_id -> termin ostatnio uruchomionego audytu (gdyby zapis w Firestore zawiódł)
+_last_refresh = None
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _cadence_days(value) -> int | None:
+    """Zamienia pole audit_cadence na liczbę dni (None = brak harmonogramu)."""
+    if isinstance(value, str):
+        value = CADENCES.get(value.strip().lower(), value)
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return None
+    return days if days > 0 else None
+
+
+# ---------------------------------------------------------------
+# Wybór lidera (advisory lock w PostgreSQL)
+# ---------------------------------------------------------------
+def _acquire_leadership() -> bool:
+    """
+    Zwraca True, jeśli ten worker jest liderem.
+    Lock jest trzymany przez całe życie połączenia — jeśli połączenie
+    padnie, Postgres sam zwolni lock i inny worker go przejmie.
+    """
+    global _lock_conn
+    if _lock_conn is not None:
+        try:
+            _lock_conn.execute(text("SELECT 1"))
+            _lock_conn.commit()
+            return True
+        except Exception as e:
+            print(f"[scheduler] Utracono połączenie z lockiem lidera: {e}")
+            _release_leadership()
+
+    conn = database.engine.connect()
+    try:
+        acquired = conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEDULER_LOCK_KEY}
+        ).scalar()
+        conn.commit()
+    except Exception:
+        conn.invalidate()  # Stan locka nieznany — nie oddajemy sesji do puli
+        raise
+    if not acquired:
+        conn.close()
+        return False
+
+    _lock_conn = conn
+    print("[scheduler] Ten worker został liderem harmonogramu.")
+    return True
+
+
+def _release_leadership():
+    global _lock_conn
+    if _lock_conn is None:
+        return
+    try:
+        _lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEDULER_LOCK_KEY})
+        _lock_conn.commit()
+        _lock_conn.close()
+    except Exception:
+        # close() oddałby połączenie (być może z lockiem) do puli SQLAlchemy.
+        # invalidate() naprawdę zamyka sesję w Postgresie, a to zwalnia lock.
+        _lock_conn.invalidate()
+    finally:
+        _lock_conn = None
+    _reset_state()
+
+
+def _reset_state():
+    global _last_refresh
+    _queue.clear()
+    _planned.clear()
+    _projects.clear()
+    _scheduled_jobs.clear()
+    _launched_due.clear()
+    _last_refresh = None
+
+
+# ---------------------------------------------------------------
+# Kolejka priorytetowa terminów
+# ---------------------------------------------------------------
+def _refresh_queue(firestore_client, now: datetime.datetime):
+    """Przebudowuje kolejkę na podstawie harmonogramów projektów w Firestore."""
+    global _last_refresh
+    queue = []
+    projects = {}
+    for doc in firestore_client.collection("projects").stream():
+        data = doc.to_dict() or {}
+        domain = data.get("domain")
+        days = _cadence_days(data.get("audit_cadence"))
+        if not domain or not days:
+            continue
+        projects[doc.id] = domain
+
+        # Przejmujemy zadania uruchomione przez poprzedniego lidera
+        if data.get("last_audit_job_id"):
+            _scheduled_jobs.setdefault(data["last_audit_job_id"], doc.id)
+
+        # Kolejny termin liczymy od zaplanowanego terminu poprzedniego audytu,
+        # a nie od faktycznego startu — inaczej jitter przesuwałby harmonogram.
+        interval = datetime.timedelta(days=days)
+        last_due = data.get("last_audit_due") or data.get("last_audit_at")
+        if doc.id in _launched_due and (last_due is None or _launched_due[doc.id] > last_due):
+            last_due = _launched_due[doc.id]
+        due = (doc.create_time or now) if last_due is None else last_due + interval
+        # Po dłuższej przerwie pomijamy zaległe terminy, zachowując stałą porę
+        if due <= now - interval:
+            due += ((now - due) // interval) * interval
+
+        planned = _planned.get(doc.id)
+        if planned and planned[0] == due:
+            run_at = planned[1]
+        else:
+            jitter = datetime.timedelta(seconds=random.uniform(0, JITTER_MINUTES * 60))
+            run_at = max(due, now) + jitter
+        queue.append((run_at, doc.id, due))
+
+    _planned.clear()
+    _planned.update({project_id: (due, run_at) for run_at, project_id, due in queue})
+    _projects.clear()
+    _projects.update(projects)
+    heapq.heapify(queue)
+    _queue[:] = queue
+    _last_refresh = now
+    print(f"[scheduler] Kolejka odświeżona: {len(queue)} projektów z harmonogramem.")
+
+
+# ---------------------------------------------------------------
+# Budżet (równoległe skany + dzienny koszt)
+# ---------------------------------------------------------------
+def _active_crawls() -> int:
+    db_session = database.SessionLocal()
+    try:
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=JOB_TIMEOUT_HOURS)
+        return crud.count_active_jobs(db_session, since)
+    finally:
+        db_session.close()
+
+
+def _budget_doc(firestore_client, now: datetime.datetime):
+    return firestore_client.collection(BUDGET_COLLECTION).document(f"budget-{now.date().isoformat()}")
+
+
+def _spent_today(firestore_client, now: datetime.datetime) -> float:
+    data = _budget_doc(firestore_client, now).get().to_dict() or {}
+    return float(data.get("spent_usd", 0.0))
+
+
+def record_spend(firestore_client, amount: float):
+    """Dolicza koszt audytu do dziennego budżetu (atomowo, z dowolnego workera)."""
+    _budget_doc(firestore_client, _utcnow()).set(
+        {"spent_usd": firestore.Increment(amount)}, merge=True
+    )
+
+
+# ---------------------------------------------------------------
+# Uruchamianie i domykanie audytów
+# ---------------------------------------------------------------
+async def _launch_audit(firestore_client, project_id: str, domain: str,
+                        due: datetime.datetime, now: datetime.datetime):
+    """Uruchamia audyt tak samo jak /start-audit i zapisuje termin w projekcie."""
+    db_session = database.SessionLocal()
+    try:
+        job = crud.create_job(db=db_session, domain=domain)
+        try:
+            onpage_task_id, onpage_cost = await d4seo_client.start_onpage_task(domain, job.job_id)
+            lighthouse_task_id, lighthouse_cost = await d4seo_client.start_lighthouse_task(domain, job.job_id)
+            crud.update_job(db_session, job.job_id, {
+                "onpage_task_id": onpage_task_id,
+                "lighthouse_task_id": lighthouse_task_id
+            })
+        except Exception:
+            crud.delete_job(db_session, job.job_id)
+            raise
+    finally:
+        db_session.close()
+
+    # Zadania D4SEO już ruszyły (i są płatne) — od tej chwili nie ponawiamy
+    # uruchomienia, a błędy zapisu w Firestore tylko logujemy.
+    _scheduled_jobs[job.job_id] = project_id
+    _launched_due[project_id] = due
+    try:
+        record_spend(firestore_client, onpage_cost + lighthouse_cost)
+        firestore_client.collection("projects").document(project_id).update({
+            "last_audit_at": now,
+            "last_audit_due": due,
+            "last_audit_job_id": job.job_id
+        })
+    except Exception as e:
+        print(f"[{job.job_id}] [scheduler] Błąd zapisu w Firestore po uruchomieniu audytu: {e}")
+    print(f"[{job.job_id}] [scheduler] Uruchomiono cykliczny audyt projektu {project_id} ({domain}).")
+
+
+async def _launch_due(firestore_client, now: datetime.datetime):
+    while _queue and _queue[0][0] <= now:
+        run_at, project_id, due = _queue[0]
+
+        if _active_crawls() >= MAX_CONCURRENT_CRAWLS:
+            print("[scheduler] Limit równoległych skanów osiągnięty — czekam.")
+            return
+        if _spent_today(firestore_client, now) + AUDIT_COST_USD > DAILY_BUDGET_USD:
+            print("[scheduler] Dzienny budżet D4SEO wyczerpany — czekam do jutra.")
+            return
+
+        heapq.heappop(_queue)
+        try:
+            await _launch_audit(firestore_client, project_id, _projects[project_id], due, now)
+            _planned.pop(project_id, None)
+        except Exception as e:
+            print(f"[scheduler] Błąd uruchamiania audytu projektu {project_id}: {e}")
+            retry_at = now + datetime.timedelta(minutes=RETRY_MINUTES)
+            _planned[project_id] = (due, retry_at)
+            heapq.heappush(_queue, (retry_at, project_id, due))
+
+
+async def _finalize_jobs(firestore_client):
+    """
+    Audyty z harmonogramu nie są odpytywane przez GPT, więc scheduler
+    sam buduje raport, gdy oba webhooki dotrą, i sprząta zadanie.
+    """
+    timeout = datetime.timedelta(hours=JOB_TIMEOUT_HOURS)
+    db_session = database.SessionLocal()
+    try:
+        for job_id, project_id in list(_scheduled_jobs.items()):
+            job = crud.get_job(db_session, job_id)
+            if not job:
+                _scheduled_jobs.pop(job_id, None)
+                continue
+
+            failed = job.onpage_status == "error" or job.lighthouse_status == "error"
+            expired = datetime.datetime.utcnow() - job.created_at > timeout
+            if job.onpage_status == "completed" and job.lighthouse_status == "completed":
+                try:
+                    onpage_summary_data = await d4seo_client.get_onpage_summary(job.onpage_task_id)
+                    lighthouse_data = await d4seo_client.get_lighthouse_data(job.lighthouse_task_id)
+                    final_report_data, all_issues = await aggregation.build_final_report(job, onpage_summary_data, lighthouse_data)
+                except Exception as e:
+                    if not expired:
+                        # Crawl jest już opłacony — zostawiamy zadanie i ponawiamy w kolejnym cyklu
+                        print(f"[{job_id}] [scheduler] Błąd podczas agregacji (ponowię): {e}")
+                        continue
+                    print(f"[{job_id}] [scheduler] Błąd podczas agregacji, zadanie przeterminowane — usuwam: {e}")
+                    updates = {"last_audit_job_id": None}
+                else:
+                    try:
+                        snapshots.record_snapshot(db_session, job.domain, final_report_data, all_issues,
+                                                  project_id=project_id, job_id=job_id)
+                    except Exception as e:
+                        print(f"[{job_id}] [scheduler] Nie udało się zapisać snapshotu: {e}")
+                    updates = {"last_report_at": _utcnow(), "last_audit_job_id": None}
+            elif failed or expired:
+                print(f"[{job_id}] [scheduler] Audyt nieudany lub przeterminowany — usuwam.")
+                updates = {"last_audit_job_id": None}
+            else:
+                continue
+
+            crud.delete_job(db_session, job_id)
+            _scheduled_jobs.pop(job_id, None)
+            try:
+                firestore_client.collection("projects").document(project_id).update(updates)
+            except Exception as e:
+                print(f"[scheduler] Nie można zaktualizować projektu {project_id}: {e}")
+    finally:
+        db_session.close()
+
+
+async def _tick(firestore_client):
+    now = _utcnow()
+    if _last_refresh is None or (now - _last_refresh).total_seconds() >= REFRESH_SECONDS:
+        _refresh_queue(firestore_client, now)
+    await _finalize_jobs(firestore_client)
+    await _launch_due(firestore_client, now)
+
+
+async def _run(firestore_client):
+    while True:
+        try:
+            if _acquire_leadership():
+                await _tick(firestore_client)
+            else:
+                _reset_state()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[scheduler] Błąd pętli harmonogramu: {e}")
+        await asyncio.sleep(TICK_SECONDS)
+
+
+# ---------------------------------------------------------------
+# Start / stop (wywoływane z main.py)
+# ---------------------------------------------------------------
+def start(firestore_client):
+    """Uruchamia pętlę harmonogramu w tle (w każdym workerze; działa tylko lider)."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run(firestore_client))
+        print("✅ Scheduler cyklicznych audytów uruchomiony.")
+
+
+async def stop():
+    """Zatrzymuje pętlę i zwalnia lock lidera."""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    _release_leadership()
@@ -0,0 +1,44 @@
+# ================================================================
+# Plik: snapshot_routes.py — historia audytów (trendy i zmiany)
+# ================================================================
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+import database
+import snapshots
+
+router = APIRouter(prefix="/api/snapshots", tags=["snapshots"])
+
+
+# ---------------------------------------------------------------
+# 📈 Endpoint: trend wyników audytów domeny
+# ---------------------------------------------------------------
+@router.get("/{domain}/trend")
+async def get_snapshot_trend(
+    domain: str,
+    limit: int = Query(52, ge=1, le=520),
+    db_session: Session = Depends(database.get_db)
+):
+    try:
+        trend = snapshots.get_trend(db_session, domain, limit)
+        if not trend:
+            return {"status": "error", "message": "Brak snapshotów dla tej domeny."}
+        return {"status": "ok", "domain": snapshots.normalize_domain(domain), "snapshots": trend}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+# ---------------------------------------------------------------
+# 🔍 Endpoint: nowe / naprawione problemy od snapshotu X
+# ---------------------------------------------------------------
+@router.get("/{domain}/changes")
+async def get_snapshot_changes(
+    domain: str,
+    since: int = Query(..., ge=0),
+    until: int | None = Query(None, ge=0),
+    db_session: Session = Depends(database.get_db)
+):
+    try:
+        return {"status": "ok", **snapshots.get_changes(db_session, domain, since, until)}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
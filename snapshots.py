@@ -0,0 +1,231 @@
+# Plik: snapshots.py
+# ================================================================
+# Historia audytów: kompaktowe snapshoty raportów (build_final_report).
+# Problemy per URL pochodzą z pełnych list zwracanych przez agregację,
+# a nie z przykładów w raporcie (te są przycięte do 3 dla GPT).
+#
+# Stan snapshotu:
+#   {"sections": {sekcja: {"status": ..., "findings": {...}}},
+#    "issues":   {sekcja: {url: [problem, ...]}}}
+# Delta względem poprzedniego stanu:
+#   {"sections": {sekcja: {"status": ..., "findings": {...}, "removed": [...]} | None},
+#    "added": {sekcja: {url: [...]}}, "fixed": {sekcja: {url: [...]}}}
+# ================================================================
+import os
+from sqlalchemy.orm import Session
+import crud
+
+# Co ile snapshotów zapisujemy pełny stan (ogranicza odtwarzanie delt)
+KEYFRAME_INTERVAL = max(1, int(os.environ.get("SNAPSHOT_KEYFRAME_INTERVAL", "52")))
+
+# Sekcje raportu, które nie są wynikami audytu
+SKIPPED_SECTIONS = ("auditMetadata",)
+
+
+def normalize_domain(domain: str) -> str:
+    return domain.strip().lower().removeprefix("https://").removeprefix("http://").rstrip("/")
+
+
+# ---------------------------------------------------------------
+# Stan i delty
+# ---------------------------------------------------------------
+def extract_state(report: dict, all_issues: dict) -> dict:
+    """
+    Wyciąga z raportu wyniki sekcji, a z `all_issues`
+    ({sekcja: [{"url", "issue"}]}) pełne zbiory problemów per URL.
+    """
+    sections = {
+        name: {"status": section.get("status"), "findings": section.get("findings") or {}}
+        for name, section in report.items()
+        if name not in SKIPPED_SECTIONS and isinstance(section, dict)
+    }
+    issues = {
+        (name, entry["url"], entry["issue"])
+        for name, entries in all_issues.items()
+        for entry in entries
+        if entry.get("url") and entry.get("issue")
+    }
+    return {"sections": sections, "issues": _issues_to_json(issues)}
+
+
+def _flatten(tree: dict) -> set:
+    """{sekcja: {url: [problemy]}} -> {(sekcja, url, problem)}"""
+    return {
+        (section, url, issue)
+        for section, urls in tree.items()
+        for url, url_issues in urls.items()
+        for issue in url_issues
+    }
+
+
+def _issues_to_json(issues: set) -> dict:
+    """{(sekcja, url, problem)} -> {sekcja: {url: [problemy]}} (posortowane)"""
+    tree = {}
+    for section, url, issue in sorted(issues):
+        tree.setdefault(section, {}).setdefault(url, []).append(issue)
+    return tree
+
+
+def compute_delta(previous: dict, current: dict) -> dict:
+    """Liczy deltę między dwoma stanami (zapisywane są tylko zmiany)."""
+    sections = {}
+    for name in previous["sections"].keys() - current["sections"].keys():
+        sections[name] = None
+    for name, section in current["sections"].items():
+        old = previous["sections"].get(name, {"status": None, "findings": {}})
+        change = {}
+        if section["status"] != old["status"]:
+            change["status"] = section["status"]
+        findings = {
+            key: value for key, value in section["findings"].items()
+            if key not in old["findings"] or old["findings"][key] != value
+        }
+        if findings:
+            change["findings"] = findings
+        removed = sorted(old["findings"].keys() - section["findings"].keys())
+        if removed:
+            change["removed"] = removed
+        if change:
+            sections[name] = change
+
+    old_issues = _flatten(previous["issues"])
+    new_issues = _flatten(current["issues"])
+    delta = {"sections": sections}
+    if new_issues - old_issues:
+        delta["added"] = _issues_to_json(new_issues - old_issues)
+    if old_issues - new_issues:
+        delta["fixed"] = _issues_to_json(old_issues - new_issues)
+    return delta
+
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    """Nakłada deltę na stan i zwraca nowy stan."""
+    sections = {name: {"status": s["status"], "findings": dict(s["findings"])}
+                for name, s in state["sections"].items()}
+    for name, change in delta.get("sections", {}).items():
+        if change is None:
+            sections.pop(name, None)
+            continue
+        section = sections.setdefault(name, {"status": None, "findings": {}})
+        if "status" in change:
+            section["status"] = change["status"]
+        section["findings"].update(change.get("findings", {}))
+        for key in change.get("removed", []):
+            section["findings"].pop(key, None)
+
+    issues = _flatten(state["issues"])
+    issues |= _flatten(delta.get("added", {}))
+    issues -= _flatten(delta.get("fixed", {}))
+    return {"sections": sections, "issues": _issues_to_json(issues)}
+
+
+def compute_stats(report: dict, state: dict) -> dict:
+    """Małe podsumowanie snapshotu — wystarcza do wykresów trendów."""
+    metadata = report.get("auditMetadata") or {}
+    metrics = {
+        f"{name}.{key}": value
+        for name, section in state["sections"].items()
+        for key, value in section["findings"].items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    return {
+        "crawlTimestamp": metadata.get("crawlTimestamp"),
+        "totalUrlsCrawled": metadata.get("totalUrlsCrawled"),
+        "statuses": {name: section["status"] for name, section in state["sections"].items()},
+        "issueCount": len(_flatten(state["issues"])),
+        "metrics": metrics
+    }
+
+
+# ---------------------------------------------------------------
+# Zapis i zapytania
+# ---------------------------------------------------------------
+def load_state(db: Session, domain: str, seq: int) -> dict | None:
+    """Odtwarza stan snapshotu `seq` (ostatni pełny stan + kolejne delty)."""
+    keyframe = crud.get_keyframe_snapshot(db, domain, seq)
+    if keyframe is None:
+        return None
+    state = keyframe.state
+    for _, delta in crud.get_snapshot_deltas(db, domain, keyframe.seq, seq):
+        state = apply_delta(state, delta)
+    return state
+
+
+def record_snapshot(db: Session, domain: str, report: dict, all_issues: dict,
+                    project_id: str | None = None, job_id: str | None = None):
+    """
+    Zapisuje ukończony raport jako kolejny snapshot domeny.
+    Raport z zadania, które ma już snapshot (np. GPT odpytał status dwa razy), jest pomijany.
+    """
+    if job_id is not None:
+        existing = crud.get_snapshot_by_job(db, job_id)
+        if existing is not None:
+            print(f"[{job_id}] Snapshot #{existing.seq} już zapisany — pomijam.")
+            return existing
+
+    domain = normalize_domain(domain)
+    state = extract_state(report, all_issues)
+    latest = crud.get_latest_snapshot(db, domain)
+
+    if latest is None:
+        seq, delta = 0, None
+    else:
+        seq = latest.seq + 1
+        delta = compute_delta(load_state(db, domain, latest.seq), state)
+
+    try:
+        snapshot = crud.create_snapshot(
+            db,
+            domain=domain,
+            project_id=project_id,
+            job_id=job_id,
+            seq=seq,
+            state=state if seq % KEYFRAME_INTERVAL == 0 else None,
+            delta=delta,
+            stats=compute_stats(report, state)
+        )
+    except Exception:
+        db.rollback()
+        raise
+    print(f"Zapisano snapshot #{seq} dla {domain}.")
+    return snapshot
+
+
+def get_trend(db: Session, domain: str, limit: int = 52) -> list:
+    """Zwraca podsumowania ostatnich snapshotów (bez odtwarzania delt)."""
+    return [
+        {"snapshot": seq, "createdAt": created_at, **(stats or {})}
+        for seq, created_at, stats in crud.list_snapshot_stats(db, normalize_domain(domain), limit)
+    ]
+
+
+def get_changes(db: Session, domain: str, since: int, until: int | None = None) -> dict:
+    """
+    Porównuje stan snapshotu `since` ze stanem `until` (domyślnie najnowszy):
+    nowe i naprawione problemy oraz sekcje, które faktycznie się różnią.
+    Każdy stan odtwarzamy od najbliższego pełnego snapshotu, więc nie
+    czytamy całej historii.
+    """
+    domain = normalize_domain(domain)
+    latest = crud.get_latest_snapshot(db, domain)
+    if latest is None:
+        raise ValueError("Brak snapshotów dla tej domeny.")
+    if since > latest.seq:
+        raise ValueError(f"Snapshot #{since} nie istnieje (najnowszy: #{latest.seq}).")
+    if until is not None and (until < since or until > latest.seq):
+        raise ValueError(f"Nieprawidłowy zakres: until musi być w przedziale #{since}–#{latest.seq}.")
+    until = latest.seq if until is None else until
+
+    diff = compute_delta(load_state(db, domain, since), load_state(db, domain, until))
+
+    def as_list(tree):
+        return [{"section": s, "url": u, "issue": i} for s, u, i in sorted(_flatten(tree))]
+
+    return {
+        "domain": domain,
+        "since": since,
+        "until": until,
+        "newIssues": as_list(diff.get("added", {})),
+        "fixedIssues": as_list(diff.get("fixed", {})),
+        "changedSections": diff["sections"]
+    }
@@ -0,0 +1,11 @@
+# Plik: tests/conftest.py
+import os
+import sys
+
+# Moduły aplikacji leżą w katalogu głównym repozytorium
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Moduły czytają konfigurację przy imporcie; testy nie łączą się z bazą ani z D4SEO
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("D4SEO_LOGIN", "test")
+os.environ.setdefault("D4SEO_PASSWORD", "test")
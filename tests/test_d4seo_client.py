@@ -0,0 +1,95 @@
+# Plik: tests/test_d4seo_client.py
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import d4seo_client
+
+LINKS_PAYLOAD = {
+    "status_message": "Ok.",
+    "tasks": [{
+        "status_message": "Ok.",
+        "result": [{
+            "crawl_progress": "finished",
+            "total_items_count": 3,
+            "items": [
+                {"type": "internal", "link_from": "a", "meta": {"sizes": [1, 2.5]}},
+                {"type": "external", "link_from": "b"},
+                {"link_from": "c", "nested": {"items": [1, 2]}},
+            ]
+        }]
+    }]
+}
+
+
+def use_payload(monkeypatch, payload, chunk_size=7):
+    """Podmienia klienta D4SEO na MockTransport, który zwraca ciało w małych kawałkach."""
+    body = json.dumps(payload).encode()
+
+    class ChunkedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for start in range(0, len(body), chunk_size):
+                yield body[start:start + chunk_size]
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=ChunkedStream()))
+    monkeypatch.setattr(d4seo_client, "client",
+                        httpx.AsyncClient(base_url=d4seo_client.BASE_URL, transport=transport))
+
+
+def fetch(*args, **kwargs):
+    return asyncio.run(d4seo_client._fetch_result(*args, **kwargs))
+
+
+def test_fetch_result_without_projection(monkeypatch):
+    use_payload(monkeypatch, LINKS_PAYLOAD)
+    assert fetch("POST", "/on_page/links", [{"id": "t"}]) == LINKS_PAYLOAD["tasks"][0]["result"][0]
+
+
+def test_fetch_result_projects_fields(monkeypatch):
+    use_payload(monkeypatch, LINKS_PAYLOAD)
+    result = fetch("POST", "/on_page/links", [{"id": "t"}], fields=("type", "link_from"))
+    assert result["total_items_count"] == 3
+    assert result["items"] == [
+        {"type": "internal", "link_from": "a"},
+        {"type": "external", "link_from": "b"},
+        {"link_from": "c"},
+    ]
+
+
+def test_fetch_result_empty_projection_drops_items(monkeypatch):
+    use_payload(monkeypatch, LINKS_PAYLOAD)
+    result = fetch("POST", "/on_page/links", [{"id": "t"}], fields=())
+    assert result == {"crawl_progress": "finished", "total_items_count": 3, "items": []}
+
+
+def test_fetch_result_keeps_result_without_items(monkeypatch):
+    payload = {"tasks": [{"result": [{"page_metrics": {"checks": {"no_title": 1}}, "total_pages": 5}]}]}
+    use_payload(monkeypatch, payload)
+    assert fetch("GET", "/on_page/summary/t") == payload["tasks"][0]["result"][0]
+
+
+def test_fetch_result_null_items(monkeypatch):
+    use_payload(monkeypatch, {"tasks": [{"result": [{"total_items_count": 0, "items": None}]}]})
+    assert fetch("POST", "/on_page/links", [{"id": "t"}]) == {"total_items_count": 0, "items": None}
+
+
+def test_fetch_result_missing_result_raises(monkeypatch):
+    use_payload(monkeypatch, {"tasks": [{"status_message": "Task not found.", "result": None}]})
+    with pytest.raises(ValueError, match="Task not found."):
+        fetch("POST", "/on_page/pages", [{"id": "t"}])
+
+
+def test_iter_result_items_scalar_items(monkeypatch):
+    use_payload(monkeypatch, {"tasks": [{"result": [{"items": [1, "two", None]}]}]})
+
+    async def collect():
+        return [item async for item in d4seo_client.iter_result_items("POST", "/on_page/links")]
+
+    assert asyncio.run(collect()) == [1, "two", None]
+
+
+def test_content_parsing_returns_first_item(monkeypatch):
+    use_payload(monkeypatch, {"tasks": [{"result": [{"items": [{"word_count": 10}, {"word_count": 20}]}]}]})
+    assert asyncio.run(d4seo_client.get_onpage_content_parsing("t", "https://example.com")) == {"word_count": 10}
@@ -0,0 +1,104 @@
+# Plik: tests/test_snapshots.py
+import pytest
+
+import snapshots
+
+
+def make_state(status="do_poprawy", findings=None, issues=()):
+    report = {
+        "auditMetadata": {"domain": "example.com"},
+        "metaData": {"status": status, "findings": findings or {"longTitles": 1}, "examples": []},
+        "security": {"status": "poprawny", "findings": {"hsts": True}, "examples": []},
+    }
+    all_issues = {"metaData": [{"url": url, "issue": issue} for url, issue in issues]}
+    return snapshots.extract_state(report, all_issues)
+
+
+def test_extract_state_ignores_issue_order():
+    issues = [(f"https://example.com/{i}", "Zduplikowany tytuł") for i in range(4)]
+    first = make_state(issues=issues)
+    second = make_state(issues=list(reversed(issues)))
+    assert snapshots.compute_delta(first, second) == {"sections": {}}
+
+
+def test_apply_delta_round_trip():
+    previous = make_state(findings={"longTitles": 1, "shortTitles": 2}, issues=[("u1", "a"), ("u2", "b")])
+    current = make_state(status="poprawny", findings={"longTitles": 0}, issues=[("u2", "b"), ("u3", "c")])
+    current["sections"].pop("security")
+
+    delta = snapshots.compute_delta(previous, current)
+    assert snapshots.apply_delta(previous, delta) == current
+    assert delta["sections"]["security"] is None
+    assert delta["sections"]["metaData"]["removed"] == ["shortTitles"]
+
+
+def test_apply_delta_chain_matches_final_state():
+    states = [
+        make_state(issues=[("u1", "a")]),
+        make_state(findings={"longTitles": 2}, issues=[("u1", "a"), ("u2", "b")]),
+        make_state(findings={"longTitles": 1}, issues=[("u2", "b")]),
+    ]
+    state = states[0]
+    for previous, current in zip(states, states[1:]):
+        state = snapshots.apply_delta(state, snapshots.compute_delta(previous, current))
+    assert state == states[-1]
+
+
+class FakeSnapshot:
+    def __init__(self, seq, state=None):
+        self.seq = seq
+        self.state = state
+
+
+def fake_history(monkeypatch, states, keyframe_interval=2):
+    """Podmienia warstwę crud na historię w pamięci (pełny stan co `keyframe_interval`)."""
+    rows = []
+    for seq, state in enumerate(states):
+        delta = None if seq == 0 else snapshots.compute_delta(states[seq - 1], state)
+        rows.append((seq, state if seq % keyframe_interval == 0 else None, delta))
+
+    monkeypatch.setattr(snapshots.crud, "get_latest_snapshot",
+                        lambda db, domain: FakeSnapshot(rows[-1][0]))
+    monkeypatch.setattr(snapshots.crud, "get_keyframe_snapshot",
+                        lambda db, domain, seq: next(FakeSnapshot(s, st) for s, st, _ in reversed(rows)
+                                                     if s <= seq and st is not None))
+    monkeypatch.setattr(snapshots.crud, "get_snapshot_deltas",
+                        lambda db, domain, after, until=None: [(s, d) for s, _, d in rows
+                                                               if s > after and (until is None or s <= until)])
+
+
+def test_get_changes_nets_issues_and_sections(monkeypatch):
+    fake_history(monkeypatch, [
+        make_state(findings={"longTitles": 1}, issues=[("u1", "a"), ("u2", "b")]),
+        make_state(status="poprawny", findings={"longTitles": 2}, issues=[("u2", "b"), ("u3", "c")]),
+        make_state(findings={"longTitles": 1}, issues=[("u1", "a"), ("u4", "d")]),
+    ])
+
+    changes = snapshots.get_changes(None, "Example.com", since=0)
+
+    assert changes["until"] == 2
+    assert changes["newIssues"] == [{"section": "metaData", "url": "u4", "issue": "d"}]
+    assert changes["fixedIssues"] == [{"section": "metaData", "url": "u2", "issue": "b"}]
+    # Status i wynik wróciły do wartości z #0 — nie ma zmian w sekcjach
+    assert changes["changedSections"] == {}
+
+
+def test_get_changes_partial_range(monkeypatch):
+    fake_history(monkeypatch, [
+        make_state(findings={"longTitles": 1}),
+        make_state(findings={"longTitles": 2}, issues=[("u1", "a")]),
+        make_state(findings={"longTitles": 3}),
+    ])
+
+    changes = snapshots.get_changes(None, "example.com", since=0, until=1)
+
+    assert changes["newIssues"] == [{"section": "metaData", "url": "u1", "issue": "a"}]
+    assert changes["changedSections"] == {"metaData": {"findings": {"longTitles": 2}}}
+
+
+@pytest.mark.parametrize("since, until", [(5, None), (1, 0), (0, 9)])
+def test_get_changes_rejects_unknown_range(monkeypatch, since, until):
+    fake_history(monkeypatch, [make_state(), make_state()])
+
+    with pytest.raises(ValueError):
+        snapshots.get_changes(None, "example.com", since, until)